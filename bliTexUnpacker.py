@@ -1,9 +1,19 @@
 import os
 import argparse
 import asyncio
+import collections
+import functools
+import mmap
 import struct
 import logging
-import time
+import sys
+import threading
+import traceback
+import numpy as np
+try:
+    import numba
+except ImportError:
+    numba = None
 
 #######################################################################################################
 # Log Colored Formatter
@@ -58,51 +68,58 @@ DXGI_FORMAT_BC3_UNORM               = 0x4D
 DXGI_FORMAT_R8G8B8A8_UNORM          = 0x1C
 D3D10_RESOURCE_DIMENSION_TEXTURE2D  = 0x03
 
-def create_r8g8b8a8_unorm_header(width: int, height: int, mipmap_count=1) -> bytes:
-    # 计算基本标志
-    flags = DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT | DDSD_PITCH
-    if mipmap_count > 1:
-        flags |= DDSD_MIPMAPCOUNT
-    # 计算行间距 (每行字节数)
-    pitch = width * 4  # 每个像素 4 字节 (8位 x 4通道)
-    # 组装 DDS_PIXELFORMAT 结构
-    ddspf = struct.pack(
+# DDS binary layouts (magic + leading DDS_HEADER fields, DDS_HEADER_DXT10)
+DDS_HEADER_HEAD_STRUCT  = struct.Struct('<4s7I')
+DDS_CAPS_STRUCT         = struct.Struct('<I')
+DDS_DX10_HEADER_STRUCT  = struct.Struct('<5I')
+# Constant parts of DDS_HEADER: dwReserved1[11], and dwCaps2/3/4 + dwReserved2
+DDS_RESERVED1_BYTES     = bytes(11 * 4)
+DDS_CAPS_TAIL_BYTES     = bytes(4 * 4)
+# DDS_PIXELFORMAT only varies by FourCC
+DDS_PIXELFORMATS = {
+    fourcc: struct.pack(
         '<II4sIIIII',
         DDS_PIXELFORMAT_SIZE,   # dwSize
         0x4,                    # dwFlags (DDPF_FOURCC)
-        b'DX10',                # dwFourCC
+        fourcc,                 # dwFourCC
         0,                      # dwRGBBitCount
         0,                      # dwRBitMask
         0,                      # dwGBitMask
         0,                      # dwBBitMask
         0                       # dwABitMask
-    )
+    ) for fourcc in (b'DX10', b'DXT1', b'DXT5')
+}
+
+def pack_dds_header(flags: int, width: int, height: int, pitch: int, mipmap_count: int, fourcc: bytes) -> bytes:
     # 计算能力标志
     caps1 = DDSCAPS_TEXTURE
     if mipmap_count > 1:
         caps1 |= DDSCAPS_COMPLEX | DDSCAPS_MIPMAP
     # 组装 DDS_HEADER
-    header = struct.pack(
-        '<IIIIIII11I32sIIIII',
+    head = DDS_HEADER_HEAD_STRUCT.pack(
+        DDS_MAGIC,               # dwMagic
         DDS_HEADER_SIZE,         # dwSize
         flags,                   # dwFlags
         height,                  # dwHeight
         width,                   # dwWidth
-        pitch,                   # dwPitch
+        pitch,                   # dwPitchOrLinearSize
         1,                       # dwDepth (2D纹理)
-        mipmap_count,            # dwMipMapCount
-        # dwReserved1 (11个保留字段)
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        ddspf,                   # DDS_PIXELFORMAT
-        caps1,                   # dwCaps
-        0,                       # dwCaps2
-        0,                       # dwCaps3
-        0,                       # dwCaps4
-        0                        # dwReserved2
+        mipmap_count             # dwMipMapCount
     )
+    return head + DDS_RESERVED1_BYTES + DDS_PIXELFORMATS[fourcc] + DDS_CAPS_STRUCT.pack(caps1) + DDS_CAPS_TAIL_BYTES
+
+@functools.lru_cache(maxsize=256)
+def create_r8g8b8a8_unorm_header(width: int, height: int, mipmap_count=1) -> bytes:
+    # 计算基本标志
+    flags = DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT | DDSD_PITCH
+    if mipmap_count > 1:
+        flags |= DDSD_MIPMAPCOUNT
+    # 计算行间距 (每行字节数)
+    pitch = width * 4  # 每个像素 4 字节 (8位 x 4通道)
+    # 组装 DDS_HEADER (使用 DX10 扩展头)
+    header = pack_dds_header(flags, width, height, pitch, mipmap_count, b'DX10')
     # 组装 DX10 扩展头
-    dx10_header = struct.pack(
-        '<5I',
+    dx10_header = DDS_DX10_HEADER_STRUCT.pack(
         DXGI_FORMAT_R8G8B8A8_UNORM, # dxgiFormat
         D3D10_RESOURCE_DIMENSION_TEXTURE2D, # resourceDimension
         0,  # miscFlag
@@ -110,7 +127,7 @@ def create_r8g8b8a8_unorm_header(width: int, height: int, mipmap_count=1) -> byt
         0   # miscFlags2
     )
     # 合并所有部分
-    return DDS_MAGIC + header + dx10_header
+    return header + dx10_header
 
 def create_bc_unorm_header(ver: int, width: int, height: int, mipmap_count=1) -> bytes:
     klen = 0
@@ -129,6 +146,11 @@ def create_bc_unorm_header(ver: int, width: int, height: int, mipmap_count=1) ->
     if width % 4 != 0 or height % 4 != 0:
         logger.warning('Width and height must be multiples of 4 for BC format')
         return None
+    return _pack_bc_unorm_header(dxt_name, klen, width, height, mipmap_count)
+
+# Only the packing is cached, the checks above must warn for every texture
+@functools.lru_cache(maxsize=256)
+def _pack_bc_unorm_header(dxt_name: bytes, klen: int, width: int, height: int, mipmap_count: int) -> bytes:
     # 计算标志位
     flags = DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT | DDSD_LINEARSIZE
     if mipmap_count > 1:
@@ -138,35 +160,8 @@ def create_bc_unorm_header(ver: int, width: int, height: int, mipmap_count=1) ->
     block_count_x = max(1, (width + 3) // 4)
     block_count_y = max(1, (height + 3) // 4)
     linear_size = block_count_x * block_count_y * klen
-    # DDS_PIXELFORMAT 结构
-    ddspf = struct.pack(
-        '<II4sIIIII',
-        DDS_PIXELFORMAT_SIZE,
-        0x4,        # DDPF_FOURCC
-        dxt_name,   # 使用 DXT 扩展头
-        0, 0, 0, 0, 0
-    )
-    # 能力标志
-    caps1 = DDSCAPS_TEXTURE
-    if mipmap_count > 1:
-        caps1 |= DDSCAPS_COMPLEX | DDSCAPS_MIPMAP
-    # 主 DDS 头
-    header = struct.pack(
-        '<IIIIIII11I32sIIIII',
-        DDS_HEADER_SIZE,
-        flags,
-        height,
-        width,
-        linear_size,  # 此处存储线性大小
-        1,            # dwDepth (2D纹理)
-        mipmap_count,
-        # 保留字段
-        0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-        ddspf,
-        caps1,
-        0, 0, 0, 0    # 其他caps和保留
-    )
-    return DDS_MAGIC + header
+    # 主 DDS 头 (此处存储线性大小，使用 DXT 扩展头)
+    return pack_dds_header(flags, width, height, linear_size, mipmap_count, dxt_name)
 
 def create_bc1_unorm_header(width: int, height: int, mipmap_count=1) -> bytes:
     return create_bc_unorm_header(1, width, height, mipmap_count)
@@ -177,6 +172,12 @@ def create_bc3_unorm_header(width: int, height: int, mipmap_count=1) -> bytes:
 #######################################################################################################
 # Texture Header
 
+TEX_HEADER_STRUCT = struct.Struct('>4I3H2B1I')
+TEX_HEADER_DTYPE = np.dtype([
+    ('bli_pos', '>u4'), ('unk0', '>u4'), ('unk1', '>u4'), ('unk2', '>u4'),
+    ('width', '>u2'), ('height', '>u2'), ('unk3', '>u2'),
+    ('fmt', 'u1'), ('mips', 'u1'), ('unk4', '>u4')])
+
 class TexHeader:
     uint32_bli_pos  = 0
     uint32_unk0     = 0
@@ -199,10 +200,18 @@ class TexHeader:
     name            = ''
     
     def __init__(self, data: bytes):
-        if len(data) < 4 * 7:
+        if len(data) < TEX_HEADER_STRUCT.size:
             logger.error('TEX header data is too small')
             return
-        values = struct.unpack('>4I3H2B1I', data)
+        self.__setup__(TEX_HEADER_STRUCT.unpack(data))
+
+    @classmethod
+    def fromRow(cls, row: np.void) -> 'TexHeader':
+        obj = cls.__new__(cls)
+        obj.__setup__(row.item())
+        return obj
+
+    def __setup__(self, values: tuple):
         self.uint32_bli_pos  = values[0]
         self.uint32_unk0     = values[1]
         self.uint32_unk1     = values[2]
@@ -214,9 +223,13 @@ class TexHeader:
         self.uint08_mips     = values[8]
         self.uint32_unk4     = values[9]
         self.__build_fmt_type__()
+        self.setName()
+        # Nothing to unpack for unknown formats, keep the header values as they are
+        if self.fmt_type == DXGI_FORMAT_UNKNOWN:
+            self.mipmap_count = self.uint08_mips
+            return
         self.__build_mips__()
         self.__build_dds__()
-        self.setName()
 
     def __build_fmt_type__(self):
         val = self.uint08_fmt
@@ -226,7 +239,7 @@ class TexHeader:
             self.fmt_name = 'R8G8B8A8'
             self.bswizzle = True
         elif val == 0x86 or val == 0xA6:
-            self.raw_size = self.uint16_width * self.uint16_height / 2
+            self.raw_size = self.uint16_width * self.uint16_height // 2
             self.fmt_type = DXGI_FORMAT_BC1_UNORM
             self.fmt_name = 'BC1'
         elif val == 0x88:
@@ -244,19 +257,16 @@ class TexHeader:
         width = self.uint16_width
         height = self.uint16_height
         self.base_size = self.raw_size
+        # BC formats need at least one 4x4 block per mipmap level
+        min_dim = 4 if self.fmt_type in (DXGI_FORMAT_BC1_UNORM, DXGI_FORMAT_BC3_UNORM) else 1
         for idx in range(self.uint08_mips):
-            add_one = 1
             if idx != 0:
                 bsize = bsize // 4
                 width = width // 2
                 height = height // 2
                 self.raw_size += bsize
-            if self.fmt_type == DXGI_FORMAT_BC1_UNORM or self.fmt_type == DXGI_FORMAT_BC3_UNORM:
-                if width < 4 or height < 4:
-                    add_one = 0
-            elif width <= 0 or height <= 0:
-                add_one = 0
-            self.mipmap_count += add_one
+            if width >= min_dim and height >= min_dim:
+                self.mipmap_count += 1
             
     def __build_dds__(self):
         if self.fmt_type == DXGI_FORMAT_R8G8B8A8_UNORM:
@@ -313,19 +323,23 @@ class TexHeader:
         return self.uint16_height
 
     def printStruct(self):
-        print(f'uint32_bli_pos  = 0x{self.uint32_bli_pos:08X}')
-        print(f'uint32_unk0     = 0x{self.uint32_unk0:08X}')
-        print(f'uint32_unk1     = 0x{self.uint32_unk1:08X}')
-        print(f'uint32_unk2     = 0x{self.uint32_unk2:08X}')
-        print(f'uint16_width    = {self.uint16_width}')
-        print(f'uint16_height   = {self.uint16_height}')
-        print(f'uint08_fmt      = 0x{self.uint08_fmt:02X}')
-        print(f'uint08_mips     = 0x{self.uint08_mips:02X}')
-        print(f'uint32_unk4     = 0x{self.uint32_unk4:04X}')
+        sys.stdout.write(
+            f'uint32_bli_pos  = 0x{self.uint32_bli_pos:08X}\n'
+            f'uint32_unk0     = 0x{self.uint32_unk0:08X}\n'
+            f'uint32_unk1     = 0x{self.uint32_unk1:08X}\n'
+            f'uint32_unk2     = 0x{self.uint32_unk2:08X}\n'
+            f'uint16_width    = {self.uint16_width}\n'
+            f'uint16_height   = {self.uint16_height}\n'
+            f'uint08_fmt      = 0x{self.uint08_fmt:02X}\n'
+            f'uint08_mips     = 0x{self.uint08_mips:02X}\n'
+            f'uint32_unk4     = 0x{self.uint32_unk4:04X}\n'
+        )
 
 #######################################################################################################
 # Bundle Texture Header
 
+BLH_HEADER_STRUCT = struct.Struct('>8I')
+
 class BlhHeader:
     uint32_prefix   = 0
     uint32_unk0     = 0
@@ -335,35 +349,29 @@ class BlhHeader:
     uint32_unk2     = 0
     uint32_padding0 = 0
     uint32_padding1 = 0
-    texHdrs: list[TexHeader] = []
     b_OK = False
     
-    def __read_string__(self, file) -> str:
-        result = bytearray()
-        while True:
-            byte = file.read(1)
-            if not byte or byte == b'\x00':
-                break
-            result.extend(byte)
-        return result.decode('utf-8')
+    def __read_string__(self, mm: mmap.mmap, offset: int) -> str:
+        end = mm.find(b'\x00', offset)
+        if end < 0:
+            end = len(mm)
+        return mm[offset:end].decode('utf-8')
 
     def __init__(self, filename: str):
+        self.texHdrs: list[TexHeader] = []
         # Check file exists
         if not os.path.exists(filename):
             logger.error(f'{filename} is not found')
             return
+        # Check blh header size
+        file_size = os.path.getsize(filename)
+        if file_size < BLH_HEADER_STRUCT.size:
+            logger.error('BLH header file is too small')
+            return
         # Start read file
-        with open(filename, 'rb') as f:
-            # Get file size
-            f.seek(0, os.SEEK_END)
-            file_size = f.tell()
-            f.seek(0, os.SEEK_SET)
+        with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
             # Read blh header
-            data = f.read(4 * 8)
-            if len(data) < 4 * 8:
-                logger.error('BLH header file is too small')
-                return
-            values = struct.unpack('>8I', data)
+            values = BLH_HEADER_STRUCT.unpack_from(mm, 0)
             self.uint32_prefix   = values[0]
             self.uint32_unk0     = values[1]
             self.uint32_lp_strtb = values[2]
@@ -377,9 +385,12 @@ class BlhHeader:
                 logger.error('BLH prefix is not 0x040E0000')
                 return
             # Read rexture header data
+            offset = BLH_HEADER_STRUCT.size
+            data = mm[offset:(offset + TEX_HEADER_DTYPE.itemsize * values[4])]
+            rows = np.frombuffer(data, dtype=TEX_HEADER_DTYPE, count=len(data) // TEX_HEADER_DTYPE.itemsize)
+            self.texHdrs = [None] * values[4]
             for i in range(values[4]):
-                texHdr = TexHeader(f.read(4 * 7))
-                self.texHdrs.append(texHdr)
+                self.texHdrs[i] = TexHeader.fromRow(rows[i]) if i < len(rows) else TexHeader(b'')
             # Load all rexture header done
             self.b_OK = True
             # Start to find rexture file name
@@ -387,16 +398,14 @@ class BlhHeader:
                 logger.warning('Invalid string table pointer, cannot build texture file name')
                 return
             # Read string pointers table
-            f.seek(values[2], os.SEEK_SET)
-            data = f.read(4 * values[4])
+            data = mm[values[2]:(values[2] + 4 * values[4])]
             if len(data) < 4 * values[4]:
                 logger.warning('Real string table size is too small, cannot build texture file name')
                 return
             # Unpacking all string data
-            addrs = struct.unpack(f'>{values[4]}I', data)
+            addrs = np.frombuffer(data, dtype='>u4')
             for i in range(values[4]):
-                f.seek(addrs[i], os.SEEK_SET)
-                self.texHdrs[i].setName(self.__read_string__(f))
+                self.texHdrs[i].setName(self.__read_string__(mm, int(addrs[i])))
 
     def isOK(self) -> bool:
         return self.b_OK
@@ -408,34 +417,49 @@ class BlhHeader:
         return self.texHdrs[index]
                 
     def printBaseStruct(self):
-        print(f'uint32_prefix   = 0x{self.uint32_prefix:08X}')
-        print(f'uint32_unk0     = 0x{self.uint32_unk0:08X}')
-        print(f'uint32_lp_strtb = 0x{self.uint32_lp_strtb:08X}')
-        print(f'uint32_unk1     = 0x{self.uint32_unk1:08X}')
-        print(f'uint32_num      = {self.uint32_num}')
-        print(f'uint32_unk2     = 0x{self.uint32_unk2:08X}')
-        print(f'uint32_padding0 = 0x{self.uint32_padding0:08X}')
-        print(f'uint32_padding1 = 0x{self.uint32_padding1:08X}')
+        sys.stdout.write(
+            f'uint32_prefix   = 0x{self.uint32_prefix:08X}\n'
+            f'uint32_unk0     = 0x{self.uint32_unk0:08X}\n'
+            f'uint32_lp_strtb = 0x{self.uint32_lp_strtb:08X}\n'
+            f'uint32_unk1     = 0x{self.uint32_unk1:08X}\n'
+            f'uint32_num      = {self.uint32_num}\n'
+            f'uint32_unk2     = 0x{self.uint32_unk2:08X}\n'
+            f'uint32_padding0 = 0x{self.uint32_padding0:08X}\n'
+            f'uint32_padding1 = 0x{self.uint32_padding1:08X}\n'
+        )
         
 #######################################################################################################
 # PS3 swizzle
 
+def morton_encode(x: int, y: int) -> int:
+    # Interleave the bits of x (even bits) and y (odd bits), same as the quadtree walk
+    x = (x | (x << 8)) & 0x00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F
+    x = (x | (x << 2)) & 0x33333333
+    x = (x | (x << 1)) & 0x55555555
+    y = (y | (y << 8)) & 0x00FF00FF
+    y = (y | (y << 4)) & 0x0F0F0F0F
+    y = (y | (y << 2)) & 0x33333333
+    y = (y | (y << 1)) & 0x55555555
+    return x | (y << 1)
+
+def is_pow2(n: int) -> bool:
+    return n > 0 and (n & (n - 1)) == 0
+
 def base_get_src_pos(size: int, x: int, y: int) -> int:
-    if size == 4:
-        return 0
-    half = size // 2
-    if x < half:
-        if y < half: # top left quadrant
-            return base_get_src_pos(half, x, y)
-        else: # bottom left quadrant
-            return base_get_src_pos(half, x, y - half) + (size * size // 2)
-    else:
-        if y < half: # top right quadrant
-            return base_get_src_pos(half, x - half, y) + (size * size // 4)
-        else: # bottom right quadrant
-            return base_get_src_pos(half, x - half, y - half) + (3 * size * size // 4)
+    # Quadtree walk down to the 4x4 tile, one level per loop so it also runs over whole coordinate grids
+    pos = 0
+    while size > 4:
+        half = size // 2
+        right = x >= half
+        bottom = y >= half
+        pos = pos + np.where(right, size * size // 4, 0) + np.where(bottom, size * size // 2, 0)
+        x = np.where(right, x - half, x)
+        y = np.where(bottom, y - half, y)
+        size = half
+    return pos
 
-def get_src_pos(width: int, height: int, x: int, y: int) -> int:
+def get_tile_src_pos(width: int, height: int, x: int, y: int) -> int:
     if width > height: # wide case
         adjusted_x = x - ((x // height) * height)
         return base_get_src_pos(height, adjusted_x, y) + ((x // height) * height)
@@ -445,73 +469,178 @@ def get_src_pos(width: int, height: int, x: int, y: int) -> int:
     else: # square case
         return base_get_src_pos(width, x, y)
 
-def ps3_unswiz(data: bytes, width: int, height: int) -> bytes:
+def get_src_pos(width: int, height: int, x: int, y: int) -> int:
+    if not (is_pow2(width) and is_pow2(height)):
+        # The quadtree walk is only a Morton code for power-of-two sides, other sizes walk it
+        # per 4x4 tile (the pixels inside a tile are still in Morton order)
+        return get_tile_src_pos(width, height, x & ~3, y & ~3) + morton_encode(x & 3, y & 3)
+    if width > height: # wide case
+        adjusted_x = x - ((x // height) * height)
+        return morton_encode(adjusted_x, y) + ((x // height) * height)
+    elif width < height: # tall case
+        adjusted_y = y - ((y // width) * width)
+        return morton_encode(x, adjusted_y) + (((y // width) * width) * width)
+    else: # square case
+        return morton_encode(x, y)
+
+# Tables are kept as intp (the index type np.take works with, no conversion per call),
+# the cache is bounded by the bytes of the tables it holds instead of their count
+PS3_PERM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_ps3_perm_cache = collections.OrderedDict()
+_ps3_perm_cache_lock = threading.Lock()
+
+def _build_ps3_perm(width: int, height: int) -> np.ndarray:
+    if not (is_pow2(width) and is_pow2(height)):
+        # The quadtree walk covers whole 4x4 tiles and has to end exactly on a 4x4 quadrant
+        size = height
+        while size > 4:
+            size //= 2
+        if width % 4 or height % 4 or size != 4:
+            return None
+    # Build the source index of every destination pixel once per texture size,
+    # get_src_pos only does integer arithmetic so it broadcasts over the pixel grid
+    ys = np.arange(height, dtype=np.intp)[:, None]
+    xs = np.arange(width, dtype=np.intp)[None, :]
+    perm = np.broadcast_to(get_src_pos(width, height, xs, ys), (height, width)).ravel()
+    # Some sizes walk past the end of the level
+    if perm.max() >= width * height:
+        return None
+    perm.flags.writeable = False
+    return perm
+
+def _ps3_perm(width: int, height: int) -> np.ndarray:
+    key = (width, height)
+    with _ps3_perm_cache_lock:
+        perm = _ps3_perm_cache.get(key)
+        if perm is not None:
+            _ps3_perm_cache.move_to_end(key)
+            return perm
+    # Built outside the lock, the worker threads may build different sizes at the same time
+    perm = _build_ps3_perm(width, height)
+    if perm is None:
+        return None
+    with _ps3_perm_cache_lock:
+        _ps3_perm_cache[key] = perm
+        cached = sum(tbl.nbytes for tbl in _ps3_perm_cache.values())
+        # Drop the least recently used tables (a table bigger than the budget is not kept at all)
+        while cached > PS3_PERM_CACHE_MAX_BYTES:
+            cached -= _ps3_perm_cache.popitem(last=False)[1].nbytes
+    return perm
+
+# Bigger textures use the numba kernel (if installed) instead of caching a permutation table
+PS3_PERM_MAX_PIXELS = 1024 * 1024
+
+def ps3_unswiz_uses_nb(width: int, height: int) -> bool:
+    # The kernel computes the Morton code without any bounds check, it only stays inside the level
+    # for power-of-two sides. Other sizes go through the table, which is checked when it is built
+    return numba is not None and width * height > PS3_PERM_MAX_PIXELS and is_pow2(width) and is_pow2(height)
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def ps3_unswiz_nb(in_array, out_array, width, height):
+        for y in numba.prange(height):
+            for x in range(width):
+                sx, sy, base = np.int64(x), np.int64(y), np.int64(0)
+                if width > height: # wide case
+                    base = (x // height) * height
+                    sx = x - base
+                elif width < height: # tall case
+                    base = (y // width) * width
+                    sy = y - base
+                    base *= width
+                sx = (sx | (sx << 8)) & 0x00FF00FF
+                sx = (sx | (sx << 4)) & 0x0F0F0F0F
+                sx = (sx | (sx << 2)) & 0x33333333
+                sx = (sx | (sx << 1)) & 0x55555555
+                sy = (sy | (sy << 8)) & 0x00FF00FF
+                sy = (sy | (sy << 4)) & 0x0F0F0F0F
+                sy = (sy | (sy << 2)) & 0x33333333
+                sy = (sy | (sy << 1)) & 0x55555555
+                out_array[y * width + x] = in_array[(sx | (sy << 1)) + base]
+
+def ps3_unswiz_into(src: memoryview, dst: memoryview, width: int, height: int) -> bool:
     total = width * height * 4
-    dlen = len(data)
+    dlen = len(src)
     if dlen < total:
-        logger.warning(f'ps3_unswiz(): Input data size is too small ({dlen} < {total}), it cannot be unswizzled')
-        return data
-    in_array = struct.unpack(f'>{width * height}I', data)
-    out = [0] * (width * height)
-    for y in range(0, height, 4):
-        for x in range(0, width, 4):
-            srcpos = get_src_pos(width, height, x, y)
-            #
-            out[y * width + x] = in_array[srcpos]
-            out[y * width + x + 1] = in_array[srcpos + 1]
-            out[(y + 1) * width + x] = in_array[srcpos + 2]
-            out[(y + 1) * width + x + 1] = in_array[srcpos + 3]
-            #
-            out[y * width + x + 2] = in_array[srcpos + 4]
-            out[y * width + x + 3] = in_array[srcpos + 5]
-            out[(y + 1) * width + x + 2] = in_array[srcpos + 6]
-            out[(y + 1) * width + x + 3] = in_array[srcpos + 7]
-            #
-            out[(y + 2) * width + x] = in_array[srcpos + 8]
-            out[(y + 2) * width + x + 1] = in_array[srcpos + 9]
-            out[(y + 3) * width + x] = in_array[srcpos + 10]
-            out[(y + 3) * width + x + 1] = in_array[srcpos + 11]
-            #
-            out[(y + 2) * width + x + 2] = in_array[srcpos + 12]
-            out[(y + 2) * width + x + 3] = in_array[srcpos + 13]
-            out[(y + 3) * width + x + 2] = in_array[srcpos + 14]
-            out[(y + 3) * width + x + 3] = in_array[srcpos + 15]
-    byte_array = struct.pack('>' + 'I' * len(out), *out)
-    return byte_array
-    
+        logger.warning(f'ps3_unswiz_into(): Input data size is too small ({dlen} < {total}), it cannot be unswizzled')
+        return False
+    if total == 0:
+        return True
+    # Pixels are only moved around, so view them as opaque native 4-byte words (no byteswap)
+    in_array = np.frombuffer(src, dtype=np.uint32, count=width * height)
+    out_array = np.frombuffer(dst, dtype=np.uint32, count=width * height)
+    if ps3_unswiz_uses_nb(width, height):
+        ps3_unswiz_nb(in_array, out_array, width, height)
+    else:
+        perm = _ps3_perm(width, height)
+        if perm is None:
+            logger.warning(f'ps3_unswiz_into(): {width}x{height} does not fit the swizzle layout, it cannot be unswizzled')
+            return False
+        np.take(in_array, perm, out=out_array)
+    return True
+
 def ps3_mipmap_unswiz(data: bytes, width: int, height: int, mipmap_count=1) -> bytes:
+    mv = memoryview(data)
+    total = sum((width >> idx) * (height >> idx) * 4 for idx in range(mipmap_count))
+    out = bytearray(min(total, len(mv)))
+    dst = memoryview(out)
     offset = 0
-    result = bytes()
     for idx in range(mipmap_count):
         klen = width * height * 4
-        cdata = data[offset:(offset + klen)]
-        result += ps3_unswiz(cdata, width, height)
+        cdata = mv[offset:(offset + klen)]
+        # A truncated level is kept as it is
+        if not ps3_unswiz_into(cdata, dst[offset:(offset + klen)], width, height):
+            dst[offset:(offset + len(cdata))] = cdata
         width = width // 2
         height = height // 2
         offset += klen
-    return result
+    return out
         
 #######################################################################################################
 # Read Write Binary File
 
-def read_bytes_from_file(idx: int, filename: str, beg_pos: int, dlen: int) -> bytes:
-    with open(filename, 'rb') as f:
-        f.seek(0, os.SEEK_END)
-        file_size = f.tell()
-        if beg_pos >= file_size:
-            logger.error(f'[{idx:03}] Start position (0x{beg_pos:08X}) is bigger than file size')
-            return None
-        if (beg_pos + dlen) > file_size:
-            logger.warning(f'[{idx:03}] Overflow at 0x{beg_pos:08X} (Size:{dlen})')
-        f.seek(beg_pos)
-        data = f.read(int(min(dlen, file_size - beg_pos)))
-    return data
+def read_bytes_from_file(idx: int, mm: mmap.mmap, beg_pos: int, dlen: int) -> memoryview:
+    file_size = len(mm)
+    if beg_pos >= file_size:
+        logger.error(f'[{idx:03}] Start position (0x{beg_pos:08X}) is bigger than file size')
+        return None
+    if (beg_pos + dlen) > file_size:
+        logger.warning(f'[{idx:03}] Overflow at 0x{beg_pos:08X} (Size:{dlen})')
+    return memoryview(mm)[beg_pos:min(beg_pos + dlen, file_size)]
 
 def write_bytes_to_file(filename: str, data: bytes, hdr: bytes):
-    with open(filename, 'wb') as f:
-        if hdr is not None:
-            f.write(hdr)
-        f.write(data)
+    bufs = [data] if hdr is None else [hdr, data]
+    with open(filename, 'wb', buffering=0) as f:
+        # Deliver header + payload with a single syscall where possible
+        written = os.writev(f.fileno(), bufs) if hasattr(os, 'writev') else 0
+        # Finish any short write (or the whole file without writev)
+        for buf in bufs:
+            mv = memoryview(buf)[written:]
+            written = max(0, written - len(buf))
+            while mv:
+                mv = mv[f.write(mv):]
+
+def unpack_texture(idx: int, mm: mmap.mmap, hdr: TexHeader, output: str):
+    # Keep the mmap views local, they must be released before the mmap is closed
+    pos = hdr.getPosition()
+    dlen = hdr.getRawSize()
+    if dlen == 0:
+        logger.warning(f'Pass unpack {hdr.getName()}')
+        return
+    data = read_bytes_from_file(idx, mm, pos, dlen)
+    if data is None:
+        logger.warning(f'Pass unpack {hdr.getName()}')
+        return
+    if hdr.getMipmapNum() != hdr.getMipmapNum(True):
+        logger.debug(f'[{idx:03}] Mipmap count reduce form {hdr.getMipmapNum()} to {hdr.getMipmapNum(True)}')    
+    if hdr.getFmtType() == DXGI_FORMAT_R8G8B8A8_UNORM and hdr.isSwizzle():
+        data = ps3_mipmap_unswiz(data, hdr.width(), hdr.height(), hdr.getMipmapNum())
+    ext_name = 'raw'
+    if hdr.getDDSHeader() is not None:
+        ext_name = 'dds'
+    output_file = f'{output}/{hdr.getFullName(False)}.{ext_name}'
+    write_bytes_to_file(output_file, data, hdr.getDDSHeader())
+    logger.info(f'[{idx:03}] {output_file}')
 
 #######################################################################################################
 # Main
@@ -524,7 +653,6 @@ async def main(args):
     logger.info(f'{args.blh} parsed DONE')
     # Show *.blh file structure
     if args.show or not args.bli:
-        time.sleep(1) 
         for i in range(bundle.getTextureNum()):
             if i == 0:
                 print('############################################')
@@ -542,6 +670,9 @@ async def main(args):
     if not os.path.exists(args.bli):
         logger.error(f'{args.bli} is not found')
         return
+    if os.path.getsize(args.bli) == 0:
+        logger.error(f'{args.bli} is empty')
+        return
     # Check output path
     output = args.out if args.out else './'
     if not os.path.exists(output):
@@ -551,27 +682,26 @@ async def main(args):
     os.makedirs(output, exist_ok=True)
     # Start unpacking *.bli
     print(f'Start unpacking {args.bli} into {output}')
-    for i in range(bundle.getTextureNum()):
-        hdr = bundle.getTextureHeader(i)
-        pos = hdr.getPosition()
-        len = hdr.getRawSize()
-        if len == 0:
-            logger.warning(f'Pass unpack {hdr.getName()}')
-            continue
-        data = read_bytes_from_file(i + 1, args.bli, pos, len)  
-        if data is None:
-            logger.warning(f'Pass unpack {hdr.getName()}')
-            continue
-        if hdr.getMipmapNum() != hdr.getMipmapNum(True):
-            logger.debug(f'[{(i + 1):03}] Mipmap count reduce form {hdr.getMipmapNum()} to {hdr.getMipmapNum(True)}')    
-        if hdr.getFmtType() == DXGI_FORMAT_R8G8B8A8_UNORM and hdr.isSwizzle():
-            data = ps3_mipmap_unswiz(data, hdr.width(), hdr.height(), hdr.getMipmapNum())
-        ext_name = 'raw'
-        if hdr.getDDSHeader() is not None:
-            ext_name = 'dds'
-        output_file = f'{output}/{hdr.getFullName(False)}.{ext_name}'
-        write_bytes_to_file(output_file, data, hdr.getDDSHeader())
-        logger.info(f'[{(i + 1):03}] {output_file}')
+    sem = asyncio.Semaphore(os.cpu_count() or 1)
+    async def process(idx: int, hdr: TexHeader):
+        async with sem:
+            # The parallel numba kernel must be launched from the main thread, from a worker thread
+            # its threading layer hangs the interpreter at exit. So these textures are unpacked one
+            # at a time on the event loop (the kernel already spreads one texture over every core),
+            # textures already handed to the worker threads keep running meanwhile
+            if hdr.getFmtType() == DXGI_FORMAT_R8G8B8A8_UNORM and hdr.isSwizzle() and ps3_unswiz_uses_nb(hdr.width(), hdr.height()):
+                unpack_texture(idx, mm, hdr, output)
+            else:
+                await asyncio.to_thread(unpack_texture, idx, mm, hdr, output)
+    with open(args.bli, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # Let every task finish before the mmap is closed, even if one of them failed
+        results = await asyncio.gather(*[process(i + 1, bundle.getTextureHeader(i)) for i in range(bundle.getTextureNum())], return_exceptions=True)
+        errors = [res for res in results if isinstance(res, BaseException)]
+        # The tracebacks still reference the failed frames (and their mmap views)
+        for err in errors:
+            traceback.clear_frames(err.__traceback__)
+    if errors:
+        raise errors[0]
 
 def args_parser():
     parser = argparse.ArgumentParser(description='Invizimals Texture Unpacker')
@@ -1,6 +1,16 @@
-import os, argparse, asyncio, struct, json, logging, time, math
+import os, argparse, asyncio, struct, json, logging, time, mmap, traceback
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple
+import numpy as np
+try:
+    import numba
+except ImportError:
+    numba = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 #######################################################################################################
 # Log Colored Formatter
@@ -26,9 +36,40 @@ logger = logging.getLogger('main')
 logger.setLevel(logging.DEBUG)
 logger.addHandler(handler)
 
+#######################################################################################################
+# JSON encoder
+
+def orjson_dumps(obj) -> bytes:
+    # orjson (if installed) only supports a 2 spaces indent, the stdlib fallback keeps 4 spaces
+    if orjson is None:
+        return None
+    data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+    # orjson writes NaN/Infinity as null where the stdlib encoder keeps them, so fall back whenever
+    # a null shows up (a real None or "null" inside a string only costs the slower encoder)
+    return None if b'null' in data else data
+
+def json_dumps(obj) -> str:
+    data = orjson_dumps(obj)
+    if data is not None:
+        return data.decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, indent=4)
+
+def json_dump_file(obj, path: str):
+    data = orjson_dumps(obj)
+    if data is not None:
+        # orjson already returns UTF-8 bytes, write them as is
+        with open(path, 'wb') as file:
+            file.write(data)
+        return
+    # Stream the encoder output into the file, the whole document is never held as one string
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(obj, file, ensure_ascii=False, indent=4)
+
 #######################################################################################################
 # Binary stream reader
 
+U32_STRUCT = struct.Struct('>I')
+
 class BinStreamReader:
     @staticmethod
     def read_uint32_data(file, b_print=False) -> list[int]:
@@ -37,7 +78,7 @@ class BinStreamReader:
             data = file.read(4)
             if len(data) < 4:
                 return []
-            val = struct.unpack('>I', data)[0]
+            val = U32_STRUCT.unpack(data)[0]
             if val == 0:
                 break
             array.append(val)
@@ -46,28 +87,50 @@ class BinStreamReader:
                 print(f'0x{num:08X}')
         return array
     @staticmethod
-    def read_string(file, b_print=False) -> str:
-        result = bytearray()
-        while True:
-            byte = file.read(1)
-            if not byte or byte == b'\x00':
-                file.seek(-1, os.SEEK_CUR)
-                break
-            result.extend(byte)
-        rtn = result.decode('utf-8')
-        if b_print:
-            print(rtn)
-        return rtn
+    def read_cstring(buf, offset: int) -> str:
+        # NUL terminated string at an absolute offset of a mmap/bytes buffer, one find() instead of a read loop
+        end = buf.find(b'\x00', offset)
+        return buf[offset:(end if end >= 0 else len(buf))].decode('utf-8')
+
+class MmapFileReader:
+    """File-like reader over a read-only mmap, seek/tell only move an integer cursor"""
+    def __init__(self, mm: mmap.mmap):
+        self.mm = mm
+        self.size = len(mm)
+        self.pos = 0
+    def read(self, size=-1) -> bytes:
+        end = self.size if size < 0 else self.pos + size
+        data = self.mm[self.pos:end]
+        self.pos += len(data)
+        return data
+    def view(self, size: int) -> memoryview:
+        # Zero-copy variant of read(), the mmap stays alive as long as the view does
+        data = memoryview(self.mm)[self.pos:(self.pos + size)]
+        self.pos += len(data)
+        return data
+    def seek(self, offset: int, whence=os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f'negative seek position {offset}')
+        self.pos = offset
+        return self.pos
+    def tell(self) -> int:
+        return self.pos
 
 class ReformValue:
     @staticmethod
-    def I2f(uint32_val: int) -> float:
-        binary_data = struct.pack('I', uint32_val)
-        return struct.unpack('f', binary_data)[0]
+    def I2f(uint32_vals) -> np.ndarray:
+        # Reinterpret uint32 bit patterns as float32, widened to float64 for the math that follows
+        return np.asarray(uint32_vals, dtype=np.uint32).view(np.float32).astype(np.float64)
 
 #######################################################################################################
 # PAK Header
 
+PAK_HEADER_STRUCT = struct.Struct('>8I')
+
 class PakHeader:
     uint32_prefix       = 0
     uint32_unk0         = 0
@@ -82,16 +145,14 @@ class PakHeader:
     
     def __init__(self, file):
         self.file = file
-        # Get file size
-        self.file.seek(0, os.SEEK_END)
-        self.file_size = self.file.tell()
+        self.file_size = self.file.size
         self.file.seek(0, os.SEEK_SET)
         # Read header
         data = self.file.read(4 * 8)
         if len(data) < 4 * 8:
             logger.error('PAK header file is too small')
             return
-        values = struct.unpack('>8I', data)
+        values = PAK_HEADER_STRUCT.unpack(data)
         self.uint32_prefix          = values[0]
         self.uint32_unk0            = values[1]
         self.uint32_unk1            = values[2]
@@ -122,6 +183,8 @@ class PakHeader:
 #######################################################################################################
 # Entry Pointer
 
+ENTRY_POINTER_STRUCT = struct.Struct('>5I')
+
 class EntryPointer:
     uint32_mesh_ptr     = 0
     uint32_unk0         = 0
@@ -133,16 +196,14 @@ class EntryPointer:
     
     def __init__(self, file, offset: int):
         self.file = file
-        # Get file size
-        self.file.seek(0, os.SEEK_END)
-        self.file_size = self.file.tell()
+        self.file_size = self.file.size
         self.file.seek(offset, os.SEEK_SET)
         # Read entry data
         data = self.file.read(4 * 5)
         if len(data) < 4 * 5:
             logger.error('PAK entry data size is too small')
             return
-        values = struct.unpack('>5I', data)
+        values = ENTRY_POINTER_STRUCT.unpack(data)
         self.uint32_mesh_ptr    = values[0]
         self.uint32_unk0        = values[1]
         self.uint32_bone_ptr    = values[2]
@@ -164,32 +225,70 @@ class EntryPointer:
 #######################################################################################################
 # Mesh Paser
 
+MESH_SECTION_HEADER_STRUCT = struct.Struct('>12I')
+MESH_LIST_INFO_STRUCT = struct.Struct('>2I')
+
+# Below this vertex count the NumPy remap is already cheaper than calling into the numba kernel
+BLEND_REMAP_NB_MIN_VERTICES = 4096
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def remap_blend_indices_nb(blend_idx, mapping, out):
+        # Single pass over the blend index slots, out-of-range indices are passed through unchanged
+        n = mapping.shape[0]
+        max_idx = 0
+        invalid = 0
+        for i in range(blend_idx.shape[0]):
+            for j in range(blend_idx.shape[1]):
+                b = blend_idx[i, j]
+                if b > max_idx:
+                    max_idx = b
+                if b < n:
+                    out[i, j] = mapping[b]
+                else:
+                    out[i, j] = b
+                    invalid += 1
+        return max_idx, invalid
+
+def remap_blend_indices(blend_idx: np.ndarray, bone_indices: list[int]) -> Tuple[np.ndarray, int, int]:
+    mapping = np.asarray(bone_indices, dtype=np.int64)
+    if numba is not None and blend_idx.shape[0] >= BLEND_REMAP_NB_MIN_VERTICES:
+        out = np.empty(blend_idx.shape, dtype=np.int64)
+        max_idx, invalid = remap_blend_indices_nb(blend_idx, mapping, out)
+        return out, int(max_idx), int(invalid)
+    n = len(mapping)
+    b_invalid = blend_idx >= n
+    if n > 0:
+        out = np.where(b_invalid, blend_idx, mapping[np.minimum(blend_idx, n - 1)])
+    else:
+        out = blend_idx.astype(np.int64)
+    return out, int(blend_idx.max()), int(np.count_nonzero(b_invalid))
+
 class MeshData:
     name            = ''
     d_offset        = 0
     # Polygon Param Set -------------------
     f_count         = 0
-    faces           = []
+    faces           = None  # (f_count, 3) uint16
     face_addr       = 0
     min_f_idx       = 0
     max_f_idx       = 0
     # Vertex Param Set -------------------
     v_count         = 0
-    positions       = []
+    positions       = None  # (v_count, 3) float32
     position_addr   = 0
-    normals         = []
+    normals         = None  # (v_count, 3) float32
     normal_addr     = 0
-    tangents        = []
+    tangents        = None  # (v_count, 3) float32
     tangent_addr    = 0
-    binormals       = []
+    binormals       = None  # (v_count, 3) float32
     binormal_addr   = 0
-    weights         = []
+    weights         = None  # (v_count, 3) float32
     weights_addr    = 0
-    blend_idx_list  = []
+    blend_idx_list  = None  # (v_count, 3) mapped bone indices
     blend_idx_addr  = 0
     max_blend_idx   = 0
-    bone_indices    = []
-    uvs             = []
+    uvs             = None  # (v_count, 2) float16
     uv_addr         = 0
     # Other Param Set -------------------
     eof_addr        = 0
@@ -288,29 +387,15 @@ class MeshData:
         self.face_addr = file.tell()
         dlen = self.f_count * 3 * 2
         hnum = self.f_count * 3
-        data = file.read(dlen)
+        data = file.view(dlen)
         if len(data) < dlen:
             logger.error(f'[idx={self.index:02}] Mesh face data size is too small')
             return 0
-        max_val = 0x0000
-        min_val = 0xFFFF
-        values = struct.unpack(f'>{hnum}H', data)
-        for i in range(self.f_count):
-            pos = i * 3
-            if max_val < values[pos + 0]:
-                max_val = values[pos + 0]
-            if max_val < values[pos + 1]:
-                max_val = values[pos + 1]
-            if max_val < values[pos + 2]:
-                max_val = values[pos + 2]
-            if min_val > values[pos + 0]:
-                min_val = values[pos + 0]
-            if min_val > values[pos + 1]:
-                min_val = values[pos + 1]
-            if min_val > values[pos + 2]:
-                min_val = values[pos + 2]
-            face = [values[pos + 0], values[pos + 1], values[pos + 2]]
-            self.faces.append(face)
+        # Byteswap once into a native array, the reductions below (and any later use) skip the per-element swap
+        values = np.frombuffer(data, dtype='>u2', count=hnum).astype(np.uint16)
+        max_val = int(values.max())
+        min_val = int(values.min())
+        self.faces = values.reshape(self.f_count, 3)
         if max_val + 1 > self.v_count:
             logger.error(f'[idx={self.index:02}] Mismatch of faces and vertices ({max_val} > {self.v_count - 1})')
             return 0
@@ -323,83 +408,31 @@ class MeshData:
         return file.tell()
         
     def __parse_vertices_step__(self, file) -> int:
-        bone_indice_size = len(self.bone_indices)
-        warning_indice_cnt = 0
-        for i in range(self.v_count):
-            # Read position
-            if i == 0:
-                self.position_addr = file.tell()
-            data = file.read(12)
-            if len(data) < 12:
-                logger.error(f'[idx={self.index:02}] Cannot read vertice.position')
-                return 0
-            values = struct.unpack('>3f', data)
-            xyz = [values[0], values[1], values[2]]
-            self.positions.append(xyz)
-            # Read normal -----------------------------------
-            if i == 0:
-                self.normal_addr = file.tell()
-            data = file.read(12)
-            if len(data) < 12:
-                logger.error(f'[idx={self.index:02}] Cannot read vertice.normal')
-                return 0
-            values = struct.unpack('>3f', data)
-            normal = [values[0], values[1], values[2]]
-            self.normals.append(normal)
-            # Read tangent ----------------------------------
-            if i == 0:
-                self.tangent_addr = file.tell()
-            data = file.read(12)
-            if len(data) < 12:
-                logger.error(f'[idx={self.index:02}] Cannot read vertice.tangent')
-                return 0
-            values = struct.unpack('>3f', data)
-            tangent = [values[0], values[1], values[2]]
-            self.tangents.append(tangent)
-            # Read binormal ---------------------------------
-            if i == 0:
-                self.binormal_addr = file.tell()
-            data = file.read(12)
-            if len(data) < 12:
-                logger.error(f'[idx={self.index:02}] Cannot read vertice.binormal')
-                return 0
-            values = struct.unpack('>3f', data)
-            binormal = [values[0], values[1], values[2]]
-            self.binormals.append(binormal)
-            # Read weight slot ---------------------------------
-            if i == 0:
-                self.weights_addr = file.tell()
-            data = file.read(12)
-            if len(data) < 12:
-                logger.error(f'[idx={self.index:02}] Cannot read vertice.weights')
-                return 0
-            values = struct.unpack('>3f', data)
-            weights = [values[0], values[1], values[2]]
-            self.weights.append(weights)
-            # Read blend index slot ---------------------------------
-            if i == 0:
-                self.blend_idx_addr = file.tell()
-            data = file.read(4)
-            if len(data) < 4:
-                logger.error(f'[idx={self.index:02}] Cannot read vertice.blend_index')
-                return 0
-            values = struct.unpack('>4B', data)
-            if self.max_blend_idx < values[0]:
-                self.max_blend_idx = values[0]
-            if self.max_blend_idx < values[1]:
-                self.max_blend_idx = values[1]
-            if self.max_blend_idx < values[2]:
-                self.max_blend_idx = values[2]
-            if values[0] >= bone_indice_size:
-                warning_indice_cnt += 1
-            if values[1] >= bone_indice_size:
-                warning_indice_cnt += 1
-            if values[2] >= bone_indice_size:
-                warning_indice_cnt += 1
-            a1 = self.bone_indices[values[0]] if values[0] < bone_indice_size else values[0]
-            a2 = self.bone_indices[values[1]] if values[1] < bone_indice_size else values[1]
-            a3 = self.bone_indices[values[2]] if values[2] < bone_indice_size else values[2]
-            self.blend_idx_list.append([a1, a2, a3])
+        # Vertex layout: position, normal, tangent, binormal, weights (3 x float each) + blend indices (4 x uint8)
+        stride = 64
+        base = file.tell()
+        self.position_addr  = base
+        self.normal_addr    = base + 12
+        self.tangent_addr   = base + 24
+        self.binormal_addr  = base + 36
+        self.weights_addr   = base + 48
+        self.blend_idx_addr = base + 60
+        dlen = self.v_count * stride
+        data = file.view(dlen)
+        if len(data) < dlen:
+            fields = ['position', 'normal', 'tangent', 'binormal', 'weights', 'blend_index']
+            logger.error(f'[idx={self.index:02}] Cannot read vertice.{fields[min((len(data) % stride) // 12, 5)]}')
+            return 0
+        values = np.frombuffer(data, dtype='>f4').astype(np.float32).reshape(self.v_count, 16)
+        self.positions = values[:, 0:3]
+        self.normals   = values[:, 3:6]
+        self.tangents  = values[:, 6:9]
+        self.binormals = values[:, 9:12]
+        self.weights   = values[:, 12:15]
+        # Read blend index slot ---------------------------------
+        blend_idx = np.frombuffer(data, dtype=np.uint8).reshape(self.v_count, stride)[:, 60:63]
+        self.blend_idx_list, max_idx, warning_indice_cnt = remap_blend_indices(blend_idx, self.bone_indices)
+        self.max_blend_idx = max(self.max_blend_idx, max_idx)
         if warning_indice_cnt > 0:
             logger.warning(f'[idx={self.index:02}] There are {warning_indice_cnt} bone indices may not correct')
         return file.tell()
@@ -407,14 +440,11 @@ class MeshData:
     def __parse_uv_step__(self, file) -> int:
         self.uv_addr = file.tell()
         dlen = self.v_count * 2 * 2
-        for i in range(self.v_count):
-            data = file.read(4)
-            if len(data) < 4:
-                logger.error(f'[idx={self.index:02}] Cannot read vertice.texcoord')
-                return 0
-            values = struct.unpack('>2e', data)
-            texcoord = [values[0], values[1]]
-            self.uvs.append(texcoord)
+        data = file.view(dlen)
+        if len(data) < dlen:
+            logger.error(f'[idx={self.index:02}] Cannot read vertice.texcoord')
+            return 0
+        self.uvs = np.frombuffer(data, dtype='>f2').astype(np.float16).reshape(self.v_count, 2)
         remainder = dlen % 16
         if remainder > 0:
             padding_len = 16 - remainder
@@ -434,29 +464,27 @@ class MeshData:
         print(f'V.BlendIdx Addr : 0x{self.blend_idx_addr:X} (MAX: {self.max_blend_idx})')
         print(f'V.Texcoord Addr : 0x{self.uv_addr:X}')
         print(f'EOF Addr        : 0x{self.eof_addr:X}')
-        print(f'MeshParamSets   : ' + json.dumps(self.get_axe_json_data(), ensure_ascii=False, indent=4))
+        print(f'MeshParamSets   : ' + json_dumps(self.get_axe_json_data()))
 
 class MeshPaser:
     uint32_prefix       = 0
     base_offset         = 0
     mesh_count          = 0
-    mesh_data_list      = []
     file_size           = 0
     file                = None
     
     def __init__(self, file, offset: int):
+        self.mesh_data_list: list[MeshData] = []
         self.base_offset = offset
         self.file = file
-        # Get file size
-        self.file.seek(0, os.SEEK_END)
-        self.file_size = self.file.tell()
+        self.file_size = self.file.size
         self.file.seek(offset, os.SEEK_SET)
         # Read header
         data = self.file.read(0x30)
         if len(data) < 0x30:
             logger.error('Mesh data session size is too small')
             return
-        values = struct.unpack('>12I', data)
+        values = MESH_SECTION_HEADER_STRUCT.unpack(data)
         self.uint32_prefix = values[0]
         if self.uint32_prefix != 0x144C0000:
             return
@@ -466,8 +494,13 @@ class MeshPaser:
             return
         # Build mesh list
         self.mesh_data_list = self.__build_mesh_header_list__(ptr)
-        for i in range(len(self.mesh_data_list)):
-            self.mesh_data_list[i].start_paser(i, self.file)
+        if len(self.mesh_data_list) == 0:
+            return
+        # Meshes are independent, each worker gets its own cursor over the shared mapping
+        workers = min(len(self.mesh_data_list), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda i: self.mesh_data_list[i].start_paser(i, MmapFileReader(self.file.mm)),
+                          range(len(self.mesh_data_list))))
         
     def __seek_mesh_heder_list__(self, offset: int) -> Tuple[int, int]:
         self.file.seek(self.base_offset + offset, os.SEEK_SET)
@@ -476,7 +509,7 @@ class MeshPaser:
             logger.error('Cannot seek mesh header list (-1)')
             return 0, 0
         # Find the number of mesh
-        values = struct.unpack('>2I', data)
+        values = MESH_LIST_INFO_STRUCT.unpack(data)
         mesh_count = values[1] >> 16
         # Seek & find mesh list pointer
         self.file.seek(self.base_offset + values[0], os.SEEK_SET)
@@ -484,7 +517,7 @@ class MeshPaser:
         if len(data) < 4:
             logger.error('Cannot seek mesh header list (-2)')
             return 0, 0
-        ptr = struct.unpack('>I', data)[0] - 16
+        ptr = U32_STRUCT.unpack(data)[0] - 16
         if ptr >= self.file_size:
             logger.error('Invalid mesh list pointer')
             return 0, 0
@@ -498,11 +531,11 @@ class MeshPaser:
         for i in range(self.mesh_count):
             b_indices = self.__build_mapping_bone_indices__()
             b_indices_count = len(b_indices)
-            data = self.file.read(0x30)
+            data = self.file.view(0x30)
             if len(data) < 0x30:
                 logger.error(f'[idx={i:02}] Stop build mesh header list, caused by reading fail')
                 return res
-            values = struct.unpack('>12I', data)
+            values = np.frombuffer(data, dtype='>u4', count=12).tolist()
             v_count = values[0] & 0xFFFF
             f_count = (values[0] >> 16) // 3
             d_offset = values[1]
@@ -521,7 +554,7 @@ class MeshPaser:
             if b_indices_count == 0:
                 logger.warning(f'[idx={i:02}] No bone indices of this mesh, skip ...')
                 continue
-            logger.debug(f'[idx={i:02}] d_offset=0x{d_offset:08x} v_count={v_count} f_count={f_count} b_indices.size={b_indices_count}')
+            logger.debug('[idx=%02d] d_offset=0x%08x v_count=%d f_count=%d b_indices.size=%d', i, d_offset, v_count, f_count, b_indices_count)
             res.append(MeshData(f'mesh_{d_offset:08x}', v_count, f_count, b_indices, self.base_offset + d_offset))
             pre_offset = d_offset
             mesh_count += 1
@@ -530,25 +563,23 @@ class MeshPaser:
         return res
 
     def __build_mapping_bone_indices__(self) -> list[int]:
-        dlen = 0
-        indices = []
+        # Zero terminated list of (beg_id << 16 | count) slots, padded to 16 bytes, so scan it block by block
+        slots = []
         while True:
-            data = self.file.read(4)
-            dlen += len(data)
-            if len(data) < 4:
+            data = self.file.view(16)
+            block = np.frombuffer(data, dtype='>u4', count=len(data) // 4)
+            zeros = np.flatnonzero(block == 0)
+            if len(zeros) > 0:
+                slots.append(block[:zeros[0]])
                 break
-            slot = struct.unpack('>I', data)[0]
-            if slot == 0:
+            slots.append(block)
+            if len(data) < 16:
                 break
-            count = slot & 0xFFFF
-            beg_id = slot >> 16
-            for i in range(count):
-                indices.append(beg_id + i)
-        remainder = dlen % 16
-        if remainder > 0:
-            padding_len = 16 - remainder
-            self.file.read(padding_len)
-        return indices
+        slots = np.concatenate(slots).astype(np.int64)
+        counts = slots & 0xFFFF
+        # Expand every run into beg_id, beg_id + 1, ..., beg_id + count - 1
+        run_beg = np.repeat((slots >> 16) - (np.cumsum(counts) - counts), counts)
+        return (run_beg + np.arange(len(run_beg))).tolist()
         
     def is_valid_data(self) -> bool:
         if self.uint32_prefix != 0x144C0000:
@@ -567,48 +598,48 @@ class MeshPaser:
 #######################################################################################################
 # Bones Paser
 
+BONE_SECTION_HEADER_STRUCT = struct.Struct('>12I')
+BONE_ENTRY_STRUCT = struct.Struct('>7I')
+# Matrix slots checked per step while looking for the end of the matrix list
+BONE_MATRIX_SCAN_ROWS = 256
+
+if numba is not None:
+    @numba.njit(cache=True, nogil=True)
+    def scan_bone_matrix_nb(buf, beg):
+        # Same match as the NumPy scan, but stops at the first hit instead of masking the whole tail
+        zero_rows = 0
+        pos = np.int64(beg)
+        while pos + 16 <= buf.shape[0]:
+            w = (np.int64(buf[pos + 12]) << 24) | (np.int64(buf[pos + 13]) << 16) | (np.int64(buf[pos + 14]) << 8) | np.int64(buf[pos + 15])
+            pos += 16
+            if w == 0x3F800000 and zero_rows >= 3:
+                return pos
+            zero_rows = zero_rows + 1 if w == 0 else 0
+        return 0
+
 class BoneMatrix:
-    float_tx1 = []
-    float_tx2 = []
-    float_tx3 = []
-    float_tx4 = []
-    float_xyz = []
-    scale_xyz = []
-    
-    def __init__(self, values: list[int]):
-        if len(values) < 16:
-            logger.error('Bone matrix input list size is too small')
-            return
-        self.float_xyz = [ 0.0, 0.0, 0.0 ]
-        self.float_tx1 = [ ReformValue.I2f(values[0]),  ReformValue.I2f(values[1]),  ReformValue.I2f(values[2]),  ReformValue.I2f(values[3])  ]
-        self.float_tx2 = [ ReformValue.I2f(values[4]),  ReformValue.I2f(values[5]),  ReformValue.I2f(values[6]),  ReformValue.I2f(values[7])  ]
-        self.float_tx3 = [ ReformValue.I2f(values[8]),  ReformValue.I2f(values[9]),  ReformValue.I2f(values[10]), ReformValue.I2f(values[11]) ]
-        self.float_tx4 = [ ReformValue.I2f(values[12]), ReformValue.I2f(values[13]), ReformValue.I2f(values[14]), ReformValue.I2f(values[15]) ]
+    __slots__ = ('float_mtx', 'float_xyz', 'scale_xyz', 'float_tx1', 'float_tx2', 'float_tx3', 'float_tx4')
+
+    def __init__(self, float_mtx: np.ndarray):
+        # (4, 4) view into the matrix array shared by all bones of the BonesPaser
+        self.float_mtx = float_mtx
+        self.float_xyz = np.zeros(3)
         self.scale_xyz = self.__build_scale_factor__()
+        # Row views (TX4 holds the translation)
+        self.float_tx1 = self.float_mtx[0]
+        self.float_tx2 = self.float_mtx[1]
+        self.float_tx3 = self.float_mtx[2]
+        self.float_tx4 = self.float_mtx[3]
         
-    def __build_scale_factor__(self):
-        return [math.sqrt((self.float_tx1[0] ** 2) + (self.float_tx2[0] ** 2) + (self.float_tx3[0] ** 2)),
-                math.sqrt((self.float_tx1[1] ** 2) + (self.float_tx2[1] ** 2) + (self.float_tx3[1] ** 2)),
-                math.sqrt((self.float_tx1[2] ** 2) + (self.float_tx2[2] ** 2) + (self.float_tx3[2] ** 2))]
-
-    def get_parent_matrix(self):
-        return [    [ self.float_tx1[0], self.float_tx1[1], self.float_tx1[2], 0.0 ], 
-                    [ self.float_tx2[0], self.float_tx2[1], self.float_tx2[2], 0.0 ],
-                    [ self.float_tx3[0], self.float_tx3[1], self.float_tx3[2], 0.0 ],
-                    [ 0.0, 0.0, 0.0, 1.0 ]  ]
-                    
-    def get_current_matrix(self):
-        return [    [ 1.0, 0.0, 0.0, -self.float_tx4[0] ], 
-                    [ 0.0, 1.0, 0.0, -self.float_tx4[1] ],
-                    [ 0.0, 0.0, 1.0, -self.float_tx4[2] ],
-                    [ 0.0, 0.0, 0.0, 1.0 ]  ]
-
-    def set_xyz_float(self, values: list[int]):
+    def __build_scale_factor__(self) -> np.ndarray:
+        # Column lengths of the 3x3 rotation/scale part
+        rot = self.float_mtx[:3, :3]
+        return np.sqrt(np.einsum('ij,ij->j', rot, rot))
+
+    def set_xyz_float(self, values: np.ndarray):
         if len(values) < 3:
             return
-        self.float_xyz[0] = ReformValue.I2f(values[0])
-        self.float_xyz[1] = ReformValue.I2f(values[1])
-        self.float_xyz[2] = ReformValue.I2f(values[2])
+        self.float_xyz = values[:3]
         
     def print(self, b_show_xyz_only=True):
         if not b_show_xyz_only:
@@ -619,17 +650,13 @@ class BoneMatrix:
         print('VAL :', format(self.float_xyz[0], '.4f') + ',', format(self.float_xyz[1], '.4f') + ',', format(self.float_xyz[2], '.4f'))
         
 class BoneData:
-    id          = 0
-    index       = 0
-    name        = '' 
-    parent_idx  = -1
-    matrix      = None
-    translation = []
+    __slots__ = ('id', 'index', 'name', 'parent_idx', 'matrix', 'translation')
     
     def __init__(self, index: int, id: int, name: str, matrix: BoneMatrix):
         self.id = id
         self.index = index
         self.name = name
+        self.parent_idx = -1
         self.matrix = matrix
         self.translation = [ self.matrix.float_xyz[0], self.matrix.float_xyz[1], self.matrix.float_xyz[2] ]
         
@@ -671,17 +698,19 @@ def build_hierarchy(bones):
     return tree, root_indices, error_nodes
 
 def print_tree(node_idx, bones, tree, prefix='', is_last=True):
-    """遞歸打印樹狀結構"""
-    bone = bones[node_idx]
-    # 當前節點顯示
-    connector = "└── " if is_last else "├── "
-    print(f"{prefix}{connector}{bone.name}")
-    # 子節點處理
-    children = tree.get(node_idx, [])
-    for i, child_idx in enumerate(children):
-        is_last_child = i == len(children) - 1
+    """以顯式堆疊打印樹狀結構 (不受遞歸深度限制)"""
+    stack = [(node_idx, prefix, is_last)]
+    while stack:
+        node_idx, prefix, is_last = stack.pop()
+        bone = bones[node_idx]
+        # 當前節點顯示
+        connector = "└── " if is_last else "├── "
+        print(f"{prefix}{connector}{bone.name}")
+        # 子節點反序入棧, 保持原本的打印順序
+        children = tree.get(node_idx, [])
         new_prefix = prefix + ("    " if is_last else "│   ")
-        print_tree(child_idx, bones, tree, new_prefix, is_last_child)
+        for i in range(len(children) - 1, -1, -1):
+            stack.append((children[i], new_prefix, i == len(children) - 1))
 
 def print_bone_tree(bones):
     """主打印函數"""
@@ -707,23 +736,25 @@ class BonesPaser:
     base_offset         = 0
     bones_matrix_ptr    = 0
     bones_num           = 0
-    bone_data_list      = []
     file_size           = 0
     file                = None
     
     def __init__(self, file, offset: int):
+        self.bone_data_list: list[BoneData] = []
+        self.matrices = np.zeros((0, 4, 4))
+        self.record_bone_ids: dict[int, int] = {}
+        self.bone_names: dict[int, str] = {}
         self.base_offset = offset
         self.file = file
-        # Get file size
-        self.file.seek(0, os.SEEK_END)
-        self.file_size = self.file.tell()
+        self.mm = file.mm
+        self.file_size = self.file.size
         self.file.seek(offset, os.SEEK_SET)
         # Read header
         data = self.file.read(0x30)
         if len(data) < 0x28:
             logger.error('Bones data session size is too small')
             return
-        values = struct.unpack('>12I', data)
+        values = BONE_SECTION_HEADER_STRUCT.unpack(data)
         self.uint32_prefix = values[0]
         if self.uint32_prefix != 0x17030000:
             return
@@ -743,60 +774,56 @@ class BonesPaser:
         # Start build bone list
         self.bone_data_list = self.__build_bone_list__(matrixs)
         # Start calculate bone translation
-        for bone in self.bone_data_list:
-            self.__update_bones_translation__(bone)
+        self.__update_bones_translation__(self.bone_data_list)
 
     def __seek_bone_matrix__(self) -> int:
-        beg = self.file.tell()
-        seek_result = 0
-        history = []
-        while True:
-            data = self.file.read(16)
-            if len(data) < 16:
-                break
-            values = struct.unpack('>4I', data)
-            history.append(values[3])
-            if len(history) > 4:
-                history.pop(0)
-            if values[3] == 0x3F800000:
-                # double check this matrix is what I need
-                if len(history) == 4 and history[0] == 0 and history[1] == 0 and history[2] == 0:
-                    pos = self.file.tell()
-                    if pos > 0x40:
-                        seek_result = pos - 0x40
-                    break
-        if seek_result > 0:
-            self.file.seek(seek_result, os.SEEK_SET)
-            return seek_result
-        # Move back to the beginning (for fail to seek matrix case)
-        self.file.seek(beg, os.SEEK_SET)
-        return 0
+        # Scan from the end of the 0x30 bytes section header, 16 bytes per matrix row
+        beg = self.base_offset + 0x30
+        rows = max(self.file_size - beg, 0) // 16
+        if rows < 4:
+            return 0
+        if numba is not None:
+            pos = int(scan_bone_matrix_nb(np.frombuffer(self.mm, dtype=np.uint8), beg))
+            return pos - 0x40 if pos > 0x40 else 0
+        # The last column of a bone matrix is (0, 0, 0, 1.0f), find the first 4 rows matching it
+        w = np.frombuffer(self.mm, dtype='>u4', count=rows * 4, offset=beg)[3::4]
+        hits = np.flatnonzero((w[3:] == 0x3F800000) & (w[:-3] == 0) & (w[1:-2] == 0) & (w[2:-1] == 0))
+        if len(hits) == 0:
+            return 0
+        pos = beg + (int(hits[0]) + 4) * 16
+        return pos - 0x40 if pos > 0x40 else 0
         
     def __build_bone_matrix__(self) -> list[BoneMatrix]:
-        beg = self.file.tell()
-        res = []
+        # The matrix list ends at the first 64 bytes slot without a (0, 0, 0, 1.0f) column, check it a fixed window of slots at a time
+        total = (self.file_size - self.bones_matrix_ptr) // (16 * 4)
+        count = 0
         while True:
-            data = self.file.read(16 * 4)
-            if len(data) < 16 * 4:
+            if count >= total:
+                # Ran into EOF without a terminating slot
                 return []
-            values = struct.unpack('>16I', data)
-            if values[3] == 0 and values[7] == 0 and values[11] == 0 and values[15] == 0x3F800000:
-                res.append(BoneMatrix(values))
-                continue
-            break
-        # Move back to the beginning of matrix
-        self.file.seek(beg, os.SEEK_SET)
-        return res
+            rows = min(BONE_MATRIX_SCAN_ROWS, total - count)
+            slab = np.frombuffer(self.mm, dtype='>u4', count=rows * 16, offset=self.bones_matrix_ptr + count * 64).reshape(rows, 16)
+            valid = (slab[:, 3] == 0) & (slab[:, 7] == 0) & (slab[:, 11] == 0) & (slab[:, 15] == 0x3F800000)
+            if not valid.all():
+                count += int(np.argmin(valid))
+                break
+            count += rows
+        # One (N, 4, 4) float array for all bones, each BoneMatrix only holds a view of its slot
+        self.matrices = ReformValue.I2f(np.frombuffer(self.mm, dtype='>u4', count=count * 16, offset=self.bones_matrix_ptr)).reshape(-1, 4, 4)
+        return [ BoneMatrix(mtx) for mtx in self.matrices ]
         
     def __build_bone_list__(self, matrixs: list[BoneMatrix]) -> list[BoneData]:
-        self.file.seek(self.base_offset + 0x28, os.SEEK_SET)
-        res = []
-        for i in range(self.bones_num):
-            data = self.file.read(0x1C)
-            if len(data) < 0x1C:
-                logger.error('Bones table size is too small')
-                return
-            values = struct.unpack('>7I', data)
+        res = [None] * self.bones_num
+        # Unpack every complete record of the table in one pass
+        beg = self.base_offset + 0x28
+        count = min(self.bones_num, max(self.file_size - beg, 0) // 0x1C)
+        table = memoryview(self.mm)[beg:(beg + count * 0x1C)]
+        records = list(BONE_ENTRY_STRUCT.iter_unpack(table))
+        # The first 3 words of a record are the XYZ floats, reinterpret the whole column at once
+        xyz = np.frombuffer(table, dtype='>f4').reshape(count, 7)[:, :3].astype(np.float64)
+        # Parent pointers normally target a record of this table, map record offset -> bone ID once
+        self.record_bone_ids = { beg + i * 0x1C: values[3] >> 16 for i, values in enumerate(records) }
+        for i, values in enumerate(records):
             # Read the name of bone
             bone_name = self.__read_bone_name__(values[6])
             # Read bone ID
@@ -805,51 +832,47 @@ class BonesPaser:
             parent_idx = self.__find_parent_index__(values[4])
             # Push to list
             obj = BoneData(i, bone_id, bone_name, matrixs[i])
-            obj.matrix.set_xyz_float([values[0], values[1], values[2]])
+            obj.matrix.set_xyz_float(xyz[i])
             obj.parent_idx = parent_idx
-            res.append(obj)
+            res[i] = obj
+        if count < self.bones_num:
+            logger.error('Bones table size is too small')
+            return
         return res
         
-    def __update_bones_translation__(self, target: BoneData):
-        mt = self.__matrix_multiply__(target.matrix.get_parent_matrix(), target.matrix.get_current_matrix())
-        target.update_translation(mt[0][3], mt[1][3], mt[2][3])
+    def __update_bones_translation__(self, bones: list[BoneData]):
+        # All parent x current products in one batched multiply, built straight from the shared matrix array
+        parents = np.tile(np.eye(4), (len(bones), 1, 1))
+        parents[:, :3, :3] = self.matrices[:, :3, :3]
+        currents = np.tile(np.eye(4), (len(bones), 1, 1))
+        currents[:, :3, 3] = -self.matrices[:, 3, :3]
+        mts = np.einsum('nij,njk->nik', parents, currents)
+        for bone, mt in zip(bones, mts):
+            bone.update_translation(mt[0, 3], mt[1, 3], mt[2, 3])
         
     def __find_parent_index__(self, offset: int) -> Tuple[int, str]:
-        tmp_offset = self.file.tell()
         if offset == 0:
             return -1
-        self.file.seek(self.base_offset + offset, os.SEEK_SET)
-        data = self.file.read(0x1C)
-        if len(data) < 0x1C:
-            logger.warning('Cannot find parent bone, table size is too small')
-            self.file.seek(tmp_offset, os.SEEK_SET)
-            return -1
-        values = struct.unpack('>7I', data)
-        # Read the name of bone
-        bone_name = self.__read_bone_name__(values[6])
-        # Read bone ID
-        bone_cur = values[3] >> 16
+        pos = self.base_offset + offset
+        bone_cur = self.record_bone_ids.get(pos)
+        if bone_cur is None:
+            # Pointer outside the bone table, read the record it points to
+            if pos + 0x1C > self.file_size:
+                logger.warning('Cannot find parent bone, table size is too small')
+                return -1
+            bone_cur = BONE_ENTRY_STRUCT.unpack_from(self.mm, pos)[3] >> 16
         if bone_cur < 0 or bone_cur >= self.bones_num:
-            self.file.seek(tmp_offset, os.SEEK_SET)
             return -1
-        self.file.seek(tmp_offset, os.SEEK_SET)
         return bone_cur
 
     def __read_bone_name__(self, offset: int) -> str:
-        tmp_offset = self.file.tell()
-        self.file.seek(self.base_offset + offset, os.SEEK_SET)
-        bone_name = BinStreamReader.read_string(self.file)
-        self.file.seek(tmp_offset, os.SEEK_SET)
+        # Records may share a name pointer, decode each one once
+        if offset in self.bone_names:
+            return self.bone_names[offset]
+        # Read straight from the mapping without moving the cursor
+        bone_name = BinStreamReader.read_cstring(self.mm, self.base_offset + offset)
+        self.bone_names[offset] = bone_name
         return bone_name
-        
-    def __matrix_multiply__(self, a, b):
-        return [
-            [
-                sum(a[i][k] * b[k][j] for k in range(len(b)))
-                for j in range(len(b[0]))
-            ]
-            for i in range(len(a))
-        ]
  
     def is_valid_data(self) -> bool:
         if self.uint32_prefix != 0x17030000:
@@ -878,7 +901,7 @@ class BonesPaser:
 def axe_packer(filename: str, m: MeshPaser, b: BonesPaser, reverse=False, rename=False, skip=0, split=False):
     output_plc = filename + '.plc'
     shared_source = os.path.basename(filename)
-    exclude_bone_indices = []
+    exclude_bone_indices = set()
     mesh_param_sets = []
     bone_node_list = []
     mesh_count = 0 if m is None else len(m.mesh_data_list)
@@ -888,7 +911,7 @@ def axe_packer(filename: str, m: MeshPaser, b: BonesPaser, reverse=False, rename
         i = pos if not reverse else mesh_count - 1 - pos
         # Skip the first N meshes
         if skip > 0:
-            exclude_bone_indices.extend(m.mesh_data_list[i].bone_indices)
+            exclude_bone_indices.update(m.mesh_data_list[i].bone_indices)
             skip -= 1
             continue
         # Rename mesh by name of bone
@@ -904,80 +927,88 @@ def axe_packer(filename: str, m: MeshPaser, b: BonesPaser, reverse=False, rename
     for pos in range(bone_count):
         mask = pos in exclude_bone_indices
         if mask:
+            # Only parents later in the list are affected, the ones already emitted stay as they are
             parent_idx = b.bone_data_list[pos].parent_idx
             if parent_idx > 0:
-                exclude_bone_indices.append(parent_idx)
-        param = b.bone_data_list[pos].get_axe_json_data(pos in exclude_bone_indices)
+                exclude_bone_indices.add(parent_idx)
+        param = b.bone_data_list[pos].get_axe_json_data(mask)
         bone_node_list.append(param)
     # Create AXE content --------------------------------------------------------------------------
-    for i in range(len(mesh_param_sets)):
-        mesh_count = 1 if split else len(mesh_param_sets)
-        param_sets = [ mesh_param_sets[i] ] if split else mesh_param_sets
-        data = {
-            "Document"      : "Advanced Mesh Reaper Parameter List Container",
-            "Version"       : 102,
-            "Endianness"    : "Big",
-            "SharedSource"  : shared_source,
-            "MeshCount"     : mesh_count,
-            "MeshParamSets" : param_sets,
-            "BoneCount"     : bone_count,
-            "BoneNodeList"  : bone_node_list
-        }
-        if split:
-            output_plc = filename + f'.{i + 1:02}.plc'
-        txt = json.dumps(data, ensure_ascii=False, indent=4)
-        with open(output_plc, "w", encoding="utf-8") as file:
-            file.write(txt)
-#           print(txt)
-        if not split:
-            break
+    data = {
+        "Document"      : "Advanced Mesh Reaper Parameter List Container",
+        "Version"       : 102,
+        "Endianness"    : "Big",
+        "SharedSource"  : shared_source,
+        "MeshCount"     : 1 if split else len(mesh_param_sets),
+        "MeshParamSets" : mesh_param_sets,
+        "BoneCount"     : bone_count,
+        "BoneNodeList"  : bone_node_list
+    }
+    # Split mode writes one file per mesh, only the mesh param sets of the document change
+    if split:
+        outputs = [ (filename + f'.{i + 1:02}.plc', [ param ]) for i, param in enumerate(mesh_param_sets) ]
+    else:
+        outputs = [ (output_plc, mesh_param_sets) ] if len(mesh_param_sets) > 0 else []
+    for output_plc, param_sets in outputs:
+        data["MeshParamSets"] = param_sets
+        json_dump_file(data, output_plc)
 
 #######################################################################################################
 # PAK Parser
 
 def pak_parser(filename: str, mesh_manual_offset: int, bone_manual_offset: int) -> Tuple[MeshPaser, BonesPaser]:
+    # Map the whole PAK once, every parser shares this reader. All parsed data is copied out of the mapping,
+    # so it is closed as soon as parsing ends
+    with open(filename, 'rb') as pak_file, mmap.mmap(pak_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        try:
+            return pak_sections_parser(MmapFileReader(mm), filename, mesh_manual_offset, bone_manual_offset)
+        except BaseException as err:
+            # The traceback still references the failed frames (and their mmap views)
+            traceback.clear_frames(err.__traceback__)
+            raise
+
+def pak_sections_parser(f: MmapFileReader, filename: str, mesh_manual_offset: int, bone_manual_offset: int) -> Tuple[MeshPaser, BonesPaser]:
     uint32_mesh_ptr = 0x00
     uint32_bone_ptr = 0x00
-    with open(filename, 'rb') as f:
-        # Manual section part
-        if mesh_manual_offset != 0:
-            uint32_mesh_ptr = mesh_manual_offset
-        if bone_manual_offset != 0:
-            uint32_bone_ptr = bone_manual_offset
-        # Auto section part
-        if uint32_mesh_ptr == 0 and uint32_bone_ptr == 0:
-            # Parse *.pak header
-            pak = PakHeader(f)
-            if not pak.is_mesh_pak():
-                logger.warning(f'You may need to set mesh & bone data section offset for this PAK manually. (For example: -p "{filename}" -m d75570 -b dc1770)')
-                print('[HINT] Mesh data section start with 0x144C0000 for prefix. (Try to use HxD Hex Editor to find it by yourself)')
-                print('[HINT] Bone data section start with 0x17030000 for prefix. (Try to use HxD Hex Editor to find it by yourself)')
-                return None, None
-            logger.debug(f'[Offset] Entry Table  : 0x{pak.uint32_entry_ptr:08X}')
-            # Parse entry pointers
-            entry = EntryPointer(f, pak.uint32_entry_ptr)
-            if not entry.is_valid_data():
-                return None, None
-            uint32_mesh_ptr = entry.uint32_mesh_ptr
-            uint32_bone_ptr = entry.uint32_bone_ptr
-        # Print section result
-        logger.debug(f'[Offset] Mesh Section : 0x{uint32_mesh_ptr:08X}')
-        logger.debug(f'[Offset] Bone Section : 0x{uint32_bone_ptr:08X}')
-        # Mesh parser
-        meshs = MeshPaser(f, uint32_mesh_ptr)
-        if not meshs.is_valid_data():
+    # Manual section part
+    if mesh_manual_offset != 0:
+        uint32_mesh_ptr = mesh_manual_offset
+    if bone_manual_offset != 0:
+        uint32_bone_ptr = bone_manual_offset
+    # Auto section part
+    if uint32_mesh_ptr == 0 and uint32_bone_ptr == 0:
+        # Parse *.pak header
+        pak = PakHeader(f)
+        if not pak.is_mesh_pak():
+            logger.warning(f'You may need to set mesh & bone data section offset for this PAK manually. (For example: -p "{filename}" -m d75570 -b dc1770)')
+            print('[HINT] Mesh data section start with 0x144C0000 for prefix. (Try to use HxD Hex Editor to find it by yourself)')
+            print('[HINT] Bone data section start with 0x17030000 for prefix. (Try to use HxD Hex Editor to find it by yourself)')
+            return None, None
+        logger.debug('[Offset] Entry Table  : 0x%08X', pak.uint32_entry_ptr)
+        # Parse entry pointers
+        entry = EntryPointer(f, pak.uint32_entry_ptr)
+        if not entry.is_valid_data():
             return None, None
-        meshs.print_mesh_list()
-        # Bones paser
-        bones = BonesPaser(f, uint32_bone_ptr)
-        if not bones.is_valid_data():
-            logger.warning('Cannot export bone information')
-            return meshs, None
-        logger.debug(f'[Offset] Bone Matrix  : 0x{bones.bones_matrix_ptr:08X}')
-        logger.debug(f'Bones Number          : 0x{bones.bones_num:08X} ({bones.bones_num})')
-        bones.print_bone_list()
-        bones.draw_bone_tree()
-        return meshs, bones
+        uint32_mesh_ptr = entry.uint32_mesh_ptr
+        uint32_bone_ptr = entry.uint32_bone_ptr
+    # Print section result
+    logger.debug('[Offset] Mesh Section : 0x%08X', uint32_mesh_ptr)
+    logger.debug('[Offset] Bone Section : 0x%08X', uint32_bone_ptr)
+    # Mesh parser
+    meshs = MeshPaser(f, uint32_mesh_ptr)
+    if not meshs.is_valid_data():
+        return None, None
+    meshs.print_mesh_list()
+    # Bones paser
+    bones = BonesPaser(f, uint32_bone_ptr)
+    if not bones.is_valid_data():
+        logger.warning('Cannot export bone information')
+        return meshs, None
+    logger.debug('[Offset] Bone Matrix  : 0x%08X', bones.bones_matrix_ptr)
+    logger.debug('Bones Number          : 0x%08X (%d)', bones.bones_num, bones.bones_num)
+    bones.print_bone_list()
+    bones.draw_bone_tree()
+    return meshs, bones
 
 #######################################################################################################
 # Main
@@ -987,12 +1018,16 @@ async def main(args):
     if not os.path.exists(args.pak):
         logger.error(f'{args.pak} is not found')
         return
+    if os.path.getsize(args.pak) == 0:
+        logger.error(f'{args.pak} is empty')
+        return
     # Start parse PAK
     bone_manual_offset = int(args.bone, 16)
     mesh_manual_offset = int(args.mesh, 16)
-    meshs, bones = pak_parser(args.pak, mesh_manual_offset, bone_manual_offset)
+    # Parsing and writing block, keep them off the event loop
+    meshs, bones = await asyncio.to_thread(pak_parser, args.pak, mesh_manual_offset, bone_manual_offset)
     # Output as *.plc for AXE
-    axe_packer(args.pak, meshs, bones, args.reverse, args.rename, args.skip, args.split)
+    await asyncio.to_thread(axe_packer, args.pak, meshs, bones, args.reverse, args.rename, args.skip, args.split)
 
 def args_parser():
     parser = argparse.ArgumentParser(description='Invizimals PAK Model Finder')